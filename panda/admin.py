@@ -15,7 +15,7 @@ from django.utils.translation import ugettext_lazy as _
 from djcelery.models import CrontabSchedule, IntervalSchedule, PeriodicTask, TaskState, WorkerState
 from tastypie.admin import ApiKeyInline
 
-from panda.models import Category, TaskStatus, UserProfile
+from panda.models import Category, Dataset, TaskStatus, UserProfile
 
 # Hide celery monitors
 admin.site.unregister(CrontabSchedule)
@@ -200,11 +200,10 @@ class CategoryAdmin(admin.ModelAdmin):
         On save, update full text metadata of related datasets. 
         """
         if change:
-            datasets = list(obj.datasets.all())
+            dataset_ids = list(obj.datasets.values_list('id', flat=True))
             obj.save()
 
-            for dataset in datasets:
-                dataset.update_full_text()
+            Dataset.bulk_update_full_text(Dataset.objects.filter(id__in=dataset_ids))
         else:
             obj.save()
 
@@ -212,11 +211,10 @@ class CategoryAdmin(admin.ModelAdmin):
         """
         On delete, update full text metadata of related datasets. 
         """
-        datasets = list(obj.datasets.all())
+        dataset_ids = list(obj.datasets.values_list('id', flat=True))
         obj.delete()
 
-        for dataset in datasets:
-            dataset.update_full_text()
+        Dataset.bulk_update_full_text(Dataset.objects.filter(id__in=dataset_ids))
 
 admin.site.register(Category, CategoryAdmin)
 
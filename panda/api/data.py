@@ -13,7 +13,7 @@ from tastypie.utils import dict_strip_unicode_keys
 from tastypie.utils.mime import build_content_type
 from tastypie.validation import Validation
 
-from panda import solr
+from panda import solr, utils
 from panda.api.datasets import DatasetResource
 from panda.api.utils import PandaApiKeyAuthentication, PandaPaginator, PandaResource, PandaSerializer
 from panda.models import Dataset
@@ -316,10 +316,11 @@ class DataResource(PandaResource):
         
             self.validate_bundle_data(bundle, request, dataset)
         
-        solr_rows = dataset.add_many_rows(request.user, data)
+        dataset.add_many_rows(request.user, data)
 
-        for bundle, solr_row in zip(bundles, solr_rows):
-            bundle.obj = SolrObject(solr_row)
+        # Build the response from the request rather than holding every Solr row
+        for bundle, (row, external_id) in zip(bundles, data):
+            bundle.obj = SolrObject(dataset_slug=dataset.slug, external_id=external_id, data=json.dumps(row))
 
         if not self._meta.always_return_data:
             return http.HttpNoContent()
@@ -452,14 +453,10 @@ class DataResource(PandaResource):
         limit = int(request.GET.get('limit', settings.PANDA_DEFAULT_SEARCH_ROWS))
         offset = int(request.GET.get('offset', 0))
 
-        if query:
-            solr_query = 'dataset_slug:%s AND %s' % (dataset.slug, query)
-        else:
-            solr_query = 'dataset_slug:%s' % dataset.slug
-
         response = solr.query(
             settings.SOLR_DATA_CORE,
-            solr_query,
+            query or '*:*',
+            fq=[utils.solr.make_dataset_filter(dataset.slug)],
             offset=offset,
             limit=limit
         )
@@ -52,6 +52,7 @@ class DatasetResource(SluggedModelResource):
         queryset = Dataset.objects.all()
         resource_name = 'dataset'
         allowed_methods = ['get', 'post', 'put', 'delete']
+        excludes = ['full_text_hash']
         always_return_data = True
 
         authentication = PandaApiKeyAuthentication()
@@ -245,7 +246,8 @@ class DatasetResource(SluggedModelResource):
         except DatasetLockedError:
             raise ImmediateHttpResponse(response=http.HttpForbidden('Dataset is currently locked by another process.'))
 
-        dataset.update_full_text()
+        # Reindexing rebuilds the metadata too, even if Solr has lost it
+        dataset.update_full_text(force=True)
 
         bundle = self.build_bundle(obj=dataset, request=request)
         bundle = self.full_dehydrate(bundle)
@@ -1,13 +1,18 @@
 #!/usr/bin/env python
 
+from collections import defaultdict
 from datetime import datetime
+import hashlib
+from itertools import chain
 import re
+import string
 import unicodedata
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.dispatch import receiver
+from django.utils import simplejson as json
 
 from panda import solr, utils
 from panda.exceptions import DataImportError, DatasetLockedError
@@ -17,6 +22,13 @@ from panda.models.slugged_model import SluggedModel
 from panda.models.task_status import TaskStatus
 from panda.tasks import get_import_task_type_for_upload, ExportCSVTask, PurgeDataTask, ReindexTask 
 
+# Everything but ASCII word characters, whitespace and hyphens
+SLUG_DELETE_CHARS = ''.join([chr(i) for i in range(256) if chr(i) not in string.ascii_letters + string.digits + '_-' + string.whitespace])
+SLUG_SEPARATOR_REGEX = re.compile('[-\s]+')
+
+EXTERNAL_ID_QUERY_BATCH_SIZE = 500
+SOLR_ADD_BUFFER_SIZE = 500
+
 class Dataset(SluggedModel):
     """
     A PANDA dataset (one table & associated metadata).
@@ -37,7 +49,7 @@ class Dataset(SluggedModel):
         help_text='The number of rows in this dataset. Null if no data has been added/imported.')
     current_task = models.ForeignKey(TaskStatus, blank=True, null=True,
         help_text='The currently executed or last finished task related to this dataset.') 
-    creation_date = models.DateTimeField(null=True,
+    creation_date = models.DateTimeField(null=True, db_index=True,
         help_text='The date this dataset was initially created.')
     creator = models.ForeignKey(User, related_name='datasets',
         help_text='The user who created this dataset.')
@@ -49,10 +61,12 @@ class Dataset(SluggedModel):
         help_text='Description of the last modification made to this Dataset.')
     last_modified_by = models.ForeignKey(User, null=True, blank=True,
         help_text='The user, if any, who last modified this dataset.')
-    locked = models.BooleanField(default=False,
+    locked = models.BooleanField(default=False, db_index=True,
         help_text='Is this table locked for writing?')
     locked_at = models.DateTimeField(null=True, default=None,
         help_text='Time this dataset was last locked.')
+    full_text_hash = models.CharField(max_length=32, null=True, default=None,
+        help_text='Hash of the full-text search metadata last sent to Solr.')
 
     class Meta:
         app_label = 'panda'
@@ -61,6 +75,13 @@ class Dataset(SluggedModel):
     def __unicode__(self):
         return self.name
 
+    @property
+    def column_names(self):
+        """
+        The names of this dataset's columns, in order.
+        """
+        return [c['name'] for c in self.column_schema or []]
+
     def save(self, *args, **kwargs):
         """
         Save the date of creation.
@@ -74,112 +95,211 @@ class Dataset(SluggedModel):
         """
         Generate Solr names for typed columns, de-duplicating as necessary.
         """
-        typed_column_names = []
+        used_names = set()
+        next_suffixes = {}
 
         for i, c in enumerate(self.column_schema):
             if not c['indexed']:
-                typed_column_names.append(None)
                 self.column_schema[i]['indexed_name'] = None
                 continue
 
             # Slugify code adapted from Django
             slug = c['name']
             slug = unicodedata.normalize('NFKD', slug).encode('ascii', 'ignore')
-            slug = unicode(re.sub('[^\w\s-]', '', slug).strip().lower())
-            slug = re.sub('[-\s]+', '_', slug)
+            slug = slug.translate(None, SLUG_DELETE_CHARS).strip().lower().decode('ascii')
+            slug = SLUG_SEPARATOR_REGEX.sub('_', slug)
 
             name = 'column_%s_%s' % (c['type'], slug)
 
             # Deduplicate within dataset
-            if name in typed_column_names:
-                n = 2
-                test_name = '%s%i' % (name, n)
+            if name in used_names:
+                n = next_suffixes.get(name, 2)
 
-                while test_name in typed_column_names:
+                while '%s%i' % (name, n) in used_names:
                     n += 1
-                    test_name = '%s%i' % (name, n)
 
-                name = test_name
+                next_suffixes[name] = n + 1
+                name = '%s%i' % (name, n)
 
-            typed_column_names.append(name)
+            used_names.add(name)
             self.column_schema[i]['indexed_name'] = name
 
     def lock(self):
         """
         Obtain an editing lock on this dataset.
+
+        The lock is taken with a single conditional UPDATE, so of any
+        processes competing for it exactly one will succeed.
         """
-        # Ensure latest state has come over from the database
-        before_lock = self.__class__.objects.get(pk=self.pk)
-        self.locked = before_lock.locked
-        self.locked_at = before_lock.locked_at
+        new_locked_at = datetime.utcnow()
 
-        if self.locked:
+        acquired = Dataset.objects.filter(pk=self.pk, locked=False).update(locked=True, locked_at=new_locked_at)
+
+        if not acquired:
             # Already locked
             raise DatasetLockedError('This dataset is currently locked by another process.')
 
-        new_locked_at = datetime.now()
-
         self.locked = True
         self.locked_at = new_locked_at
 
-        self.save()
-
-        # Refresh from database
-        after_lock = Dataset.objects.get(id=self.id)
-        self.locked = after_lock.locked
-        self.locked_at = after_lock.locked_at
-
-        if self.locked_at != new_locked_at:
-            # Somebody else got the lock
-            raise DatasetLockedError('This dataset is currently locked by another process.')
-
     def unlock(self):
         """
         Unlock this dataset so it can be edited.
         """
-        self.locked = False
-        self.lock_id = None
+        Dataset.objects.filter(pk=self.pk).update(locked=False)
 
-        self.save()
+        self.locked = False
 
-    def update_full_text(self, commit=True):
+    def _full_text_document(self, categories=None, data_upload_filenames=None, related_upload_filenames=None):
         """
-        Update the full-text search metadata for this dataset stored in Solr.
-        """
-        category_ids = []
+        Build the Solr document holding the full-text search metadata for
+        this dataset.
 
-        full_text_data = [
-            self.name,
-            self.description,
-            '%s %s' % (self.creator.first_name, self.creator.last_name),
-            self.creator.email
-        ]
+        ``categories`` is a sequence of (id, name) tuples, ordered by id so
+        that the document (and its hash) is stable.
 
-        for category in self.categories.all():
-            category_ids.append(category.id)
-            full_text_data.append(category.name)
-
-        if not category_ids:
-            category_ids.append(settings.PANDA_UNCATEGORIZED_ID)
-            full_text_data.append(settings.PANDA_UNCATEGORIZED_NAME)
+        Related objects which have already been fetched may be passed in
+        (see ``bulk_update_full_text``), otherwise they are queried for.
+        """
+        if categories is None:
+            categories = self.categories.order_by('id').values_list('id', 'name')
 
-        for data_upload in self.data_uploads.all():
-            full_text_data.append(data_upload.original_filename)
+        if data_upload_filenames is None:
+            data_upload_filenames = self.data_uploads.values_list('original_filename', flat=True)
 
-        for related_upload in self.related_uploads.all():
-            full_text_data.append(related_upload.original_filename)
+        if related_upload_filenames is None:
+            related_upload_filenames = self.related_uploads.values_list('original_filename', flat=True)
 
-        if self.column_schema is not None:
-            full_text_data.extend([c['name'] for c in self.column_schema])
+        category_ids = []
+        category_names = []
 
-        full_text = '\n'.join(full_text_data)
+        for category_id, category_name in categories:
+            category_ids.append(category_id)
+            category_names.append(category_name)
 
-        solr.add(settings.SOLR_DATASETS_CORE, [{
+        if not category_ids:
+            category_ids.append(settings.PANDA_UNCATEGORIZED_ID)
+            category_names.append(settings.PANDA_UNCATEGORIZED_NAME)
+
+        full_text = '\n'.join(chain(
+            [
+                self.name,
+                self.description,
+                '%s %s' % (self.creator.first_name, self.creator.last_name),
+                self.creator.email
+            ],
+            category_names,
+            data_upload_filenames,
+            related_upload_filenames,
+            self.column_names
+        ))
+
+        return {
             'slug': self.slug,
             'creation_date': self.creation_date.isoformat() + 'Z',
             'categories': category_ids,
             'full_text': full_text
-        }], commit=commit)
+        }
+
+    @staticmethod
+    def _hash_full_text_document(document):
+        """
+        Hash a full-text search document so unchanged metadata can be
+        detected without asking Solr.
+        """
+        return hashlib.md5(json.dumps(document, sort_keys=True)).hexdigest()
+
+    def update_full_text(self, commit=True, force=False):
+        """
+        Update the full-text search metadata for this dataset stored in Solr.
+
+        Nothing is sent if the metadata hasn't changed since it was last
+        indexed, unless ``force`` is True (e.g. after Solr has been wiped).
+        A full ``save()`` of an instance loaded before the hash was last
+        stored writes back the older hash, so restoring that earlier
+        metadata may then be skipped; reindexing forces an update.
+
+        This queries for the dataset's creator, categories and uploads.
+        When updating more than one dataset use ``bulk_update_full_text``.
+        """
+        document = self._full_text_document()
+        full_text_hash = self._hash_full_text_document(document)
+
+        if full_text_hash == self.full_text_hash and not force:
+            return
+
+        solr.add(settings.SOLR_DATASETS_CORE, [document], commit=commit)
+
+        self.full_text_hash = full_text_hash
+        self._save_fields(['full_text_hash'])
+
+    @classmethod
+    def bulk_update_full_text(cls, datasets, commit=True, batch_size=500, force=False):
+        """
+        Update the full-text search metadata for a queryset of datasets.
+
+        Creators are joined in (loading only the columns that are indexed)
+        and categories and uploads are fetched with a single query each,
+        rather than several queries per dataset.
+        Documents are sent to Solr in batches of ``batch_size`` with a single
+        commit at the end. As with ``update_full_text``, datasets whose
+        metadata hasn't changed are skipped unless ``force`` is True.
+        """
+        from panda.models.data_upload import DataUpload
+        from panda.models.related_upload import RelatedUpload
+
+        # Only load the columns that end up in the Solr document
+        datasets = list(datasets.select_related('creator').only(
+            'slug', 'name', 'description', 'creation_date', 'column_schema', 'full_text_hash', 'creator',
+            'creator__first_name', 'creator__last_name', 'creator__email'
+        ))
+
+        if not datasets:
+            return
+
+        dataset_ids = [dataset.id for dataset in datasets]
+
+        categories = defaultdict(list)
+        data_upload_filenames = defaultdict(list)
+        related_upload_filenames = defaultdict(list)
+
+        for dataset_id, category_id, category_name in cls.categories.through.objects.filter(dataset__in=dataset_ids).order_by('category').values_list('dataset', 'category', 'category__name'):
+            categories[dataset_id].append((category_id, category_name))
+
+        for dataset_id, filename in DataUpload.objects.filter(dataset__in=dataset_ids).values_list('dataset', 'original_filename'):
+            data_upload_filenames[dataset_id].append(filename)
+
+        for dataset_id, filename in RelatedUpload.objects.filter(dataset__in=dataset_ids).values_list('dataset', 'original_filename'):
+            related_upload_filenames[dataset_id].append(filename)
+
+        documents = []
+        changed_hashes = {}
+
+        for dataset in datasets:
+            document = dataset._full_text_document(
+                categories[dataset.id],
+                data_upload_filenames[dataset.id],
+                related_upload_filenames[dataset.id]
+            )
+            full_text_hash = cls._hash_full_text_document(document)
+
+            if full_text_hash == dataset.full_text_hash and not force:
+                continue
+
+            documents.append(document)
+            changed_hashes[dataset.id] = full_text_hash
+
+        if not documents:
+            return
+
+        for i in range(0, len(documents), batch_size):
+            solr.add(settings.SOLR_DATASETS_CORE, documents[i:i + batch_size], commit=False)
+
+        if commit:
+            solr.commit(settings.SOLR_DATASETS_CORE)
+
+        for dataset_id, full_text_hash in changed_hashes.items():
+            cls.objects.filter(pk=dataset_id).update(full_text_hash=full_text_hash)
 
     def delete(self, *args, **kwargs):
         """
@@ -209,7 +329,7 @@ class Dataset(SluggedModel):
             
             if self.column_schema:
                 # This is normally caught on the client.
-                if upload.columns != [c['name'] for c in self.column_schema]:
+                if upload.columns != self.column_names:
                     raise DataImportError('The columns in this file do not match those in the dataset.')
             else:
                 self.column_schema = []
@@ -298,46 +418,72 @@ class Dataset(SluggedModel):
         """
         Fetch a row from this dataset.
         """
-        response = solr.query(settings.SOLR_DATA_CORE, 'dataset_slug:%s AND external_id:%s' % (self.slug, external_id), limit=1)
+        response = solr.query(settings.SOLR_DATA_CORE, 'external_id:%s' % utils.solr.escape(external_id), fq=[utils.solr.make_dataset_filter(self.slug)], limit=1)
 
         if len(response['response']['docs']) < 1:
             return None
 
         return response['response']['docs'][0]
 
-    def add_row(self, user, data, external_id=None):
+    def add_row(self, user, data, external_id=None, commit=True):
         """
         Add (or overwrite) a row to this dataset.
+
+        If ``commit`` is False Solr will make the row visible within
+        ``SOLR_COMMIT_WITHIN`` milliseconds, or when ``flush`` is called.
+        Until then the row can not be fetched and will not be seen when
+        later writes check for existing rows, so the row count may drift if
+        the same external id is written again before it is committed.
+        The same happens if two writers add the same new external id at
+        once, as both see it as missing. Reindexing recounts the rows.
         """
         solr_row = utils.solr.make_data_row(self, data, external_id=external_id)
 
-        solr.add(settings.SOLR_DATA_CORE, [solr_row], commit=True)
+        # Check before adding so we know whether the row count changes
+        added = not external_id or not self._count_existing_rows([external_id])
+
+        solr.add(settings.SOLR_DATA_CORE, [solr_row], commit=commit, commit_within=settings.SOLR_COMMIT_WITHIN)
+
+        modified_fields = ['last_modified', 'last_modified_by', 'last_modification']
 
         if not self.sample_data:
             self.sample_data = []
         
         if len(self.sample_data) < 5:
             self.sample_data.append(data)
+            modified_fields.append('sample_data')
 
-        old_row_count = self.row_count
-        self.row_count = self._count_rows()
-        added = self.row_count - (old_row_count or 0)
         self.last_modified = datetime.utcnow()
         self.last_modified_by = user
         self.last_modification = '1 row %s' % ('added' if added else 'updated')
-        self.save()
+        self._save_fields(modified_fields, row_count_delta=1 if added else 0)
 
         return solr_row
 
-    def add_many_rows(self, user, data):
+    def add_many_rows(self, user, data, commit=True):
         """
         Shortcut for adding rows in bulk. 
 
         ``data`` must be an array of tuples in the format (data_array, external_id)
+
+        Rows are built and sent to Solr in batches of ``SOLR_ADD_BUFFER_SIZE``
+        so no more than one batch of Solr rows is held in memory at a time.
+        Unlike ``add_row`` the rows are not returned. See ``add_row`` for the
+        meaning of ``commit``.
         """
-        solr_rows = [utils.solr.make_data_row(self, d[0], external_id=d[1]) for d in data]
+        # Rows without an external id are always new, as are ids not yet in Solr
+        external_ids = set([d[1] for d in data if d[1]])
+        added = len([d for d in data if not d[1]]) + len(external_ids) - self._count_existing_rows(external_ids)
+        updated = len(data) - added
+
+        for i in range(0, len(data), SOLR_ADD_BUFFER_SIZE):
+            batch = [utils.solr.make_data_row(self, d[0], external_id=d[1]) for d in data[i:i + SOLR_ADD_BUFFER_SIZE]]
+            solr.add(settings.SOLR_DATA_CORE, batch, commit=False, commit_within=settings.SOLR_COMMIT_WITHIN)
+
+        if commit:
+            solr.commit(settings.SOLR_DATA_CORE)
 
-        solr.add(settings.SOLR_DATA_CORE, solr_rows, commit=True)
+        modified_fields = ['last_modified', 'last_modified_by', 'last_modification']
 
         if not self.sample_data:
             self.sample_data = []
@@ -345,11 +491,8 @@ class Dataset(SluggedModel):
         if len(self.sample_data) < 5:
             needed = 5 - len(self.sample_data)
             self.sample_data.extend([d[0] for d in data[:needed]])
+            modified_fields.append('sample_data')
 
-        old_row_count = self.row_count
-        self.row_count = self._count_rows()
-        added = self.row_count - (old_row_count or 0)
-        updated = len(data) - added
         self.last_modified = datetime.utcnow()
         self.last_modified_by = user
 
@@ -360,40 +503,93 @@ class Dataset(SluggedModel):
         else:
             self.last_modification = '%i rows updated' % updated
 
-        self.save()
-
-        return solr_rows
+        self._save_fields(modified_fields, row_count_delta=added)
         
-    def delete_row(self, user, external_id):
+    def delete_row(self, user, external_id, commit=True):
         """
         Delete a row in this dataset.
+
+        See ``add_row`` for the meaning of ``commit``.
         """
-        solr.delete(settings.SOLR_DATA_CORE, 'dataset_slug:%s AND external_id:%s' % (self.slug, external_id), commit=True)
+        # Check before deleting so we know whether the row count changes
+        deleted = self._count_existing_rows([external_id])
+
+        solr.delete(settings.SOLR_DATA_CORE, '%s AND external_id:%s' % (utils.solr.make_dataset_filter(self.slug), utils.solr.escape(external_id)), commit=commit, commit_within=settings.SOLR_COMMIT_WITHIN)
     
-        self.row_count = self._count_rows()
         self.last_modified = datetime.utcnow()
         self.last_modified_by = user
         self.last_modification = '1 row deleted'
-        self.save()
+        self._save_fields(['last_modified', 'last_modified_by', 'last_modification'], row_count_delta=-deleted)
 
-    def delete_all_rows(self, user,):
+    def delete_all_rows(self, user, commit=True):
         """
         Delete all rows in this dataset.
+
+        See ``add_row`` for the meaning of ``commit``.
         """
-        solr.delete(settings.SOLR_DATA_CORE, 'dataset_slug:%s' % self.slug, commit=True)
+        solr.delete(settings.SOLR_DATA_CORE, utils.solr.make_dataset_filter(self.slug), commit=commit, commit_within=settings.SOLR_COMMIT_WITHIN)
 
-        old_row_count = self.row_count
+        old_row_count = self.row_count or 0
         self.row_count = 0
         self.last_modified = datetime.utcnow()
+        self.last_modified_by = user
         self.last_modification = 'All %i rows deleted' % old_row_count
-        self.save()
+        self._save_fields(['row_count', 'last_modified', 'last_modified_by', 'last_modification'])
+
+    def flush(self):
+        """
+        Commit any row changes made with ``commit=False``, making them
+        visible to searches immediately.
+        """
+        solr.commit(settings.SOLR_DATA_CORE)
+
+    def _save_fields(self, field_names, row_count_delta=0):
+        """
+        Write only the named fields to the database, rather than saving
+        every column (including the potentially large JSON fields).
+
+        ``row_count_delta`` is added to the row count in the same UPDATE.
+        The arithmetic is done in SQL so that concurrent writers, each
+        holding their own instance, don't overwrite one another's counts.
+        """
+        values = dict([(name, getattr(self, name)) for name in field_names])
+
+        if row_count_delta:
+            # NULL + n is NULL, so start datasets without a count from zero
+            if self.row_count is None:
+                Dataset.objects.filter(pk=self.pk, row_count__isnull=True).update(row_count=0)
+
+            values['row_count'] = models.F('row_count') + row_count_delta
+
+        Dataset.objects.filter(pk=self.pk).update(**values)
+
+        if row_count_delta:
+            self.row_count = Dataset.objects.filter(pk=self.pk).values_list('row_count', flat=True)[0]
+
+    def _count_existing_rows(self, external_ids):
+        """
+        Count how many of the given external ids already have a row stored
+        in Solr for this Dataset.
+        """
+        external_ids = list(external_ids)
+        dataset_filter = utils.solr.make_dataset_filter(self.slug)
+        count = 0
+
+        # Keep each query well under Solr's maxBooleanClauses
+        for i in range(0, len(external_ids), EXTERNAL_ID_QUERY_BATCH_SIZE):
+            batch = external_ids[i:i + EXTERNAL_ID_QUERY_BATCH_SIZE]
+            query = 'external_id:(%s)' % ' OR '.join([utils.solr.escape(external_id) for external_id in batch])
+
+            count += solr.query(settings.SOLR_DATA_CORE, query, fq=[dataset_filter], limit=0)['response']['numFound']
+
+        return count
 
     def _count_rows(self):
         """
         Count the number of rows currently stored in Solr for this Dataset.
         Useful for sanity checks.
         """
-        return solr.query(settings.SOLR_DATA_CORE, 'dataset_slug:%s' % self.slug)['response']['numFound']
+        return solr.query(settings.SOLR_DATA_CORE, '*:*', fq=[utils.solr.make_dataset_filter(self.slug)], limit=0)['response']['numFound']
 
 @receiver(models.signals.post_delete, sender=Dataset)
 def on_dataset_delete(sender, **kwargs):
@@ -51,14 +51,27 @@ class SolrError(Exception):
     def __unicode__(self):
         return self.response_body
 
-def add(core, documents, commit=False):
+def _update_params(commit, commit_within):
+    """
+    Build the query parameters for an update request.
+    """
+    if commit:
+        return { 'commit': 'true' }
+    elif commit_within:
+        return { 'commitWithin': commit_within }
+    
+    return {}
+
+def add(core, documents, commit=False, commit_within=None):
     """
     Add a document or list of documents to Solr.
 
-    Does not commit changes by default.
+    Does not commit changes by default. If ``commit_within`` is given
+    (in milliseconds) Solr will commit the changes itself within
+    that time.
     """
     url = ''.join([settings.SOLR_ENDPOINT, '/', core, '/update'])
-    params = { 'commit': 'true' } if commit else {}
+    params = _update_params(commit, commit_within)
     response = requests.post(url, dumps(documents), params=params, headers={ 'Content-Type': 'application/json' })
 
     if response.status_code != 200:
@@ -78,14 +91,14 @@ def commit(core):
     
     return loads(response.content)
 
-def delete(core, q, commit=True):
+def delete(core, q, commit=True, commit_within=None):
     """
     Delete documents by query from the Solr index.
 
-    Commits changes by default.
+    Commits changes by default. See ``add`` for ``commit_within``.
     """
     url = ''.join([settings.SOLR_ENDPOINT, '/', core, '/update'])
-    params = { 'commit': 'true' } if commit else {}
+    params = _update_params(commit, commit_within)
     response = requests.post(url, dumps({ 'delete': { 'query': q } }), params=params, headers={ 'Content-Type': 'application/json' })
     
     if response.status_code != 200:
@@ -93,12 +106,20 @@ def delete(core, q, commit=True):
     
     return loads(response.content)
 
-def query(core, q, limit=10, offset=0, sort='external_id asc'):
+def query(core, q, limit=10, offset=0, sort='external_id asc', fq=None):
     """
     Execute a simple, raw query against the Solr index.
+
+    ``fq`` may be a list of filter queries, which Solr caches
+    independently of the main query.
     """
     url = ''.join([settings.SOLR_ENDPOINT, '/', core, '/select'])
-    response = requests.get(url, params={ 'q': q, 'start': offset, 'rows': limit, 'sort': sort }, headers={ 'Content-Type': 'application/json' })
+    params = { 'q': q, 'start': offset, 'rows': limit, 'sort': sort }
+
+    if fq:
+        params['fq'] = fq
+
+    response = requests.get(url, params=params, headers={ 'Content-Type': 'application/json' })
 
     if response.status_code != 200:
         raise SolrError(response)
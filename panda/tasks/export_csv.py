@@ -9,7 +9,7 @@ from csvkit import CSVKitWriter
 from django.conf import settings
 from django.utils import simplejson as json
 
-from panda import solr
+from panda import solr, utils
 from panda.tasks.export_file import ExportFileTask 
 
 SOLR_PAGE_SIZE = 500
@@ -48,11 +48,14 @@ class ExportCSVTask(ExportFileTask):
         writer = CSVKitWriter(f)
 
         # Header
-        writer.writerow([c['name'] for c in dataset.column_schema])
+        writer.writerow(dataset.column_names)
+
+        dataset_filter = utils.solr.make_dataset_filter(dataset_slug)
         
         response = solr.query(
             settings.SOLR_DATA_CORE,
-            'dataset_slug:%s' % dataset_slug,
+            '*:*',
+            fq=[dataset_filter],
             offset=0,
             limit=0
         )
@@ -63,7 +66,8 @@ class ExportCSVTask(ExportFileTask):
         while n < total_count:
             response = solr.query(
                 settings.SOLR_DATA_CORE,
-                'dataset_slug:%s' % dataset_slug,
+                '*:*',
+                fq=[dataset_filter],
                 offset=n,
                 limit=SOLR_PAGE_SIZE
             )
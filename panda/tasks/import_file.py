@@ -6,7 +6,7 @@ from celery.contrib.abortable import AbortableTask
 from django.conf import settings
 from livesettings import config_value
 
-from panda import solr
+from panda import solr, utils
 from panda.utils.mail import send_mail
 
 SOLR_ADD_BUFFER_SIZE = 500
@@ -40,7 +40,7 @@ class ImportFileTask(AbortableTask):
             finally:
                 # If import failed, clear any data that might be staged
                 if dataset.current_task.status == 'FAILURE':
-                    solr.delete(settings.SOLR_DATA_CORE, 'dataset_slug:%s' % args[0], commit=True)
+                    solr.delete(settings.SOLR_DATA_CORE, utils.solr.make_dataset_filter(args[0]), commit=True)
         finally:
             dataset.unlock()
 
@@ -5,7 +5,7 @@ import logging
 from django.conf import settings
 from celery.task import Task
 
-from panda import solr
+from panda import solr, utils
 
 class PurgeDataTask(Task):
     """
@@ -17,7 +17,7 @@ class PurgeDataTask(Task):
         log = logging.getLogger('panda.tasks.purge.data')
         log.info('Beginning purge, dataset_slug: %s' % dataset_slug)
 
-        solr.delete(settings.SOLR_DATA_CORE, 'dataset_slug:%s' % dataset_slug)
+        solr.delete(settings.SOLR_DATA_CORE, utils.solr.make_dataset_filter(dataset_slug))
 
         log.info('Finished purge, dataset_slug: %s' % dataset_slug)
 
@@ -54,15 +54,20 @@ class ReindexTask(AbortableTask):
 
             return
 
+        # Single-row writes can leave the stored count slightly off, so
+        # recount before relying on it
+        dataset.row_count = dataset._count_rows()
+        Dataset.objects.filter(id=dataset.id).update(row_count=dataset.row_count)
+
         read_buffer = []
         add_buffer = []
+        dataset_filter = utils.solr.make_dataset_filter(dataset.slug)
 
         i = 0
 
         while i < dataset.row_count:
             if not read_buffer:
-                query = 'dataset_slug: %s' % (dataset.slug)
-                response = solr.query(settings.SOLR_DATA_CORE, query, limit=SOLR_READ_BUFFER_SIZE, offset=i, sort='id asc')
+                response = solr.query(settings.SOLR_DATA_CORE, '*:*', fq=[dataset_filter], limit=SOLR_READ_BUFFER_SIZE, offset=i, sort='id asc')
                 read_buffer = response['response']['docs']
 
             data = read_buffer.pop(0)
@@ -123,7 +128,7 @@ class ReindexTask(AbortableTask):
             finally:
                 # If reindex failed, clear any data that might be staged
                 if dataset.current_task.status == 'FAILURE':
-                    solr.delete(settings.SOLR_DATA_CORE, 'dataset_slug:%s' % args[0], commit=True)
+                    solr.delete(settings.SOLR_DATA_CORE, utils.solr.make_dataset_filter(args[0]), commit=True)
         finally:
             dataset.unlock()
 
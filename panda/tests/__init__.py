@@ -11,6 +11,6 @@ from panda.tests.test_api_category import TestAPICategories
 from panda.tests.test_dataset import TestDataset
 from panda.tests.test_data_upload import TestDataUpload
 from panda.tests.test_related_upload import TestRelatedUpload
-from panda.tests.test_utils import TestCSV, TestXLS, TestXLSX
+from panda.tests.test_utils import TestCSV, TestXLS, TestXLSX, TestSolr
 from panda.tests.test_views import TestLogin
 
@@ -44,6 +44,68 @@ class TestDataset(TransactionTestCase):
 
         self.assertEqual(response['response']['numFound'], 1)
 
+    def test_bulk_update_full_text(self):
+        Dataset.objects.create(
+            name='Second dataset',
+            description='contributors',
+            creator=self.user)
+
+        # Start from an empty index so both documents must come from the bulk update
+        solr.delete(settings.SOLR_DATASETS_CORE, '*:*')
+
+        Dataset.bulk_update_full_text(Dataset.objects.all(), force=True)
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, 'contributors', sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 2)
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, self.upload.original_filename, sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 1)
+        self.assertEqual(response['response']['docs'][0]['slug'], self.dataset.slug)
+
+    def test_update_full_text_unchanged(self):
+        # Index the upload attached in setUp
+        self.dataset.update_full_text()
+
+        full_text_hash = Dataset.objects.get(id=self.dataset.id).full_text_hash
+
+        self.assertNotEqual(full_text_hash, None)
+
+        # Remove the document so we can tell whether it is sent again
+        solr.delete(settings.SOLR_DATASETS_CORE, '*:*')
+
+        self.dataset.update_full_text()
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, 'contributors', sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 0)
+
+        self.dataset.update_full_text(force=True)
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, 'contributors', sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 1)
+
+    def test_bulk_update_full_text_unchanged(self):
+        # Index the upload attached in setUp
+        self.dataset.update_full_text()
+
+        # Remove the document so we can tell whether it is sent again
+        solr.delete(settings.SOLR_DATASETS_CORE, '*:*')
+
+        Dataset.bulk_update_full_text(Dataset.objects.all())
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, 'contributors', sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 0)
+
+        Dataset.bulk_update_full_text(Dataset.objects.all(), force=True)
+
+        response = solr.query(settings.SOLR_DATASETS_CORE, 'contributors', sort='slug asc')
+
+        self.assertEqual(response['response']['numFound'], 1)
+
     def test_import_csv(self):
         self.dataset.import_data(self.user, self.upload)
 
@@ -268,6 +330,82 @@ class TestDataset(TransactionTestCase):
         self.assertNotEqual(self.dataset.last_modified, None)
         self.assertEqual(self.dataset._count_rows(), 5)
 
+    def test_add_row_concurrent(self):
+        self.dataset.import_data(self.user, self.upload, 0)
+
+        utils.wait()
+
+        # Two requests, each with its own copy of the dataset
+        first = Dataset.objects.get(id=self.dataset.id)
+        second = Dataset.objects.get(id=self.dataset.id)
+
+        first.add_row(self.user, ['5', 'Somebody', 'Else', 'Somewhere'], external_id='5')
+        second.add_row(self.user, ['6', 'Nobody', 'Else', 'Nowhere'], external_id='6')
+
+        self.assertEqual(second.row_count, 6)
+        self.assertEqual(Dataset.objects.get(id=self.dataset.id).row_count, 6)
+
+    def test_add_row_update(self):
+        self.dataset.import_data(self.user, self.upload, 0)
+
+        utils.wait()
+
+        # Refresh dataset so row_count is available
+        self.dataset = Dataset.objects.get(id=self.dataset.id)
+
+        self.dataset.add_row(self.user, ['1', 'Somebody', 'Else', 'Somewhere'], external_id='1')
+
+        self.assertEqual(self.dataset.row_count, 4)
+        self.assertEqual(self.dataset.last_modification, '1 row updated')
+        self.assertEqual(self.dataset._count_rows(), 4)
+
+    def test_add_row_deferred_commit(self):
+        self.dataset.import_data(self.user, self.upload, 0)
+
+        utils.wait()
+
+        # Refresh dataset so row_count is available
+        self.dataset = Dataset.objects.get(id=self.dataset.id)
+
+        new_row =['5', 'Somebody', 'Else', 'Somewhere']
+
+        # Make sure Solr won't commit on its own during the test
+        commit_within = settings.SOLR_COMMIT_WITHIN
+        settings.SOLR_COMMIT_WITHIN = 600000
+
+        try:
+            self.dataset.add_row(self.user, new_row, external_id='5', commit=False)
+
+            self.assertEqual(self.dataset.get_row('5'), None)
+
+            self.dataset.flush()
+        finally:
+            settings.SOLR_COMMIT_WITHIN = commit_within
+
+        row = self.dataset.get_row('5')
+
+        self.assertEqual(json.loads(row['data']), new_row)
+        self.assertEqual(self.dataset.row_count, 5)
+        self.assertEqual(self.dataset._count_rows(), 5)
+
+    def test_add_many_rows(self):
+        self.dataset.import_data(self.user, self.upload, 0)
+
+        utils.wait()
+
+        # Refresh dataset so row_count is available
+        self.dataset = Dataset.objects.get(id=self.dataset.id)
+
+        self.dataset.add_many_rows(self.user, [
+            (['1', 'Somebody', 'Else', 'Somewhere'], '1'),
+            (['5', 'Somebody', 'New', 'Somewhere'], '5'),
+            (['6', 'Nobody', 'New', 'Nowhere'], None)
+        ])
+
+        self.assertEqual(self.dataset.row_count, 6)
+        self.assertEqual(self.dataset.last_modification, '2 rows added and 1 updated')
+        self.assertEqual(self.dataset._count_rows(), 6)
+
     def test_delete_row(self):
         self.dataset.import_data(self.user, self.upload, 0)
 
@@ -284,6 +422,30 @@ class TestDataset(TransactionTestCase):
         self.assertNotEqual(self.dataset.last_modified, None)
         self.assertEqual(self.dataset._count_rows(), 3)
 
+    def test_delete_all_rows(self):
+        self.dataset.import_data(self.user, self.upload, 0)
+
+        utils.wait()
+
+        # Refresh dataset so row_count is available
+        self.dataset = Dataset.objects.get(id=self.dataset.id)
+
+        self.dataset.delete_all_rows(self.user)
+
+        # Refresh from database
+        dataset = Dataset.objects.get(id=self.dataset.id)
+
+        self.assertEqual(dataset.row_count, 0)
+        self.assertEqual(dataset.last_modified_by, self.user)
+        self.assertEqual(dataset.last_modification, 'All 4 rows deleted')
+        self.assertEqual(dataset._count_rows(), 0)
+
+    def test_delete_all_rows_empty(self):
+        self.dataset.delete_all_rows(self.user)
+
+        self.assertEqual(self.dataset.row_count, 0)
+        self.assertEqual(self.dataset.last_modification, 'All 0 rows deleted')
+
     def test_export_csv(self):
         self.dataset.import_data(self.user, self.upload)
 
@@ -343,6 +505,24 @@ class TestDataset(TransactionTestCase):
         self.assertEqual(solr.query(settings.SOLR_DATA_CORE, 'column_unicode_last_name:Germuska')['response']['numFound'], 1)
         self.assertEqual(solr.query(settings.SOLR_DATA_CORE, 'column_unicode_first_name:Joseph')['response']['numFound'], 0)
 
+    def test_reindex_recounts_rows(self):
+        self.dataset.import_data(self.user, self.upload)
+
+        utils.wait()
+
+        # Simulate a count that has drifted from what Solr holds
+        Dataset.objects.filter(id=self.dataset.id).update(row_count=7)
+        dataset = Dataset.objects.get(id=self.dataset.id)
+
+        dataset.reindex_data(self.user, typed_columns=[True, False, True, True])
+
+        utils.wait()
+
+        # Refresh from database
+        dataset = Dataset.objects.get(id=self.dataset.id)
+
+        self.assertEqual(dataset.row_count, 4)
+
     def test_reindex_complex(self):
         upload = utils.get_test_data_upload(self.user, self.dataset, filename=utils.TEST_CSV_TYPES_FILENAME)
         self.dataset.import_data(self.user, upload)
@@ -408,3 +588,10 @@ class TestDataset(TransactionTestCase):
 
         self.assertEqual([c['indexed_name'] for c in self.dataset.column_schema], ['column_int_test', None, 'column_unicode_test', 'column_unicode_test2'])
 
+
+    def test_generate_typed_column_names_many_conflicts(self):
+        self.dataset.column_schema = [{ 'name': name, 'type': 'unicode', 'indexed': True } for name in [u'test', u'test', u'test2', u'test', u'test']]
+
+        self.dataset._generate_typed_column_names()
+
+        self.assertEqual([c['indexed_name'] for c in self.dataset.column_schema], ['column_unicode_test', 'column_unicode_test2', 'column_unicode_test22', 'column_unicode_test3', 'column_unicode_test4'])
@@ -114,3 +114,11 @@ class TestXLSX(TestCase):
 
         self.assertEqual(guessed_types, ['unicode', 'datetime', 'int', 'bool', 'float', 'datetime', 'datetime', 'NoneType', 'unicode'])
 
+
+class TestSolr(TestCase):
+    def test_solr_escape(self):
+        self.assertEqual(utils.solr.escape('1'), '"1"')
+        self.assertEqual(utils.solr.escape(1), '"1"')
+        self.assertEqual(utils.solr.escape('a:b AND (c)'), '"a:b AND (c)"')
+        self.assertEqual(utils.solr.escape('OR'), '"OR"')
+        self.assertEqual(utils.solr.escape('a"b\\c'), '"a\\"b\\\\c"')
@@ -4,6 +4,21 @@ from uuid import uuid4
 
 from django.utils import simplejson as json
 
+def escape(value):
+    """
+    Quote a value as a phrase for use as a single term in a Solr query.
+
+    Quoting (rather than escaping individual characters) also keeps
+    values such as ``OR`` from being read as operators.
+    """
+    return u'"%s"' % unicode(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"')
+
+def make_dataset_filter(dataset_slug):
+    """
+    Build a filter query restricting results to one dataset's rows.
+    """
+    return 'dataset_slug:%s' % dataset_slug
+
 def make_data_row(dataset, data, external_id=None):
     solr_row = {
         'dataset_slug': dataset.slug,